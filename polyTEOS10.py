@@ -62,6 +62,11 @@ def polyTEOS10_bsq(SA,CT,p):
     tt   = CT / CTu
     pp   =   p / Zu
     
+    return _polyTEOS10_bsq(ss,tt,pp)
+
+
+def _polyTEOS10_bsq(ss,tt,pp):
+    
     # vertical reference profile of density
     R00 = 4.6494977072e+01; R01 = -5.2099962525e+00; R02 = 2.2601900708e-01
     R03 = 6.4326772569e-02; R04 = 1.5616995503e-02; R05 = -1.7243708991e-03
@@ -103,6 +108,21 @@ def polyTEOS10_bsq(SA,CT,p):
     # in-situ density
     rho = r + r0
     
+    # thermal expansion a and haline contraction b
+    a,b = _polyTEOS10_bsq_ab(ss,tt,pp)
+    
+    return rho,a,b,r0,r
+
+
+# _polyTEOS10_bsq_ab        a and b of polyTEOS10_bsq from reduced variables
+#==========================================================================
+#
+#  Thermal expansion and haline contraction coefficients of polyTEOS10_bsq,
+#  computed from the reduced variables (ss,tt,pp) without evaluating the
+#  density itself. Shared by polyTEOS10_bsq and polyTEOS10_bsq_N2.
+
+def _polyTEOS10_bsq_ab(ss,tt,pp):
+    
     # thermal expansion a
     ALP000 = -6.5025362670e-01; ALP100 = 1.6320471316e+00; ALP200 = -2.0442606277e+00
     ALP300 = 1.4222011580e+00; ALP400 = -4.4204535284e-01; ALP500 = 4.7983755487e-02
@@ -160,7 +180,113 @@ def polyTEOS10_bsq(SA,CT,p):
     
     b = b / ss ;
     
-    return rho,a,b,r0,r
+    return a,b
+    
+    
+# polyTEOS10_bsq_N2           buoyancy frequency on a vertical stencil
+#==========================================================================
+#
+# USAGE:
+#     [N2,drho,p_mid] = polyTEOS10_bsq_N2(SA,CT,p,axis=0)
+#
+# DESCRIPTION:
+#  Calculates the squared buoyancy frequency N2 and the local (in-situ)
+#  density difference across each interface between two adjacent levels
+#  of a structured grid, using the Boussinesq coefficients a and b of
+#  polyTEOS10_bsq evaluated once per interface at the averaged properties
+#  (SA[k]+SA[k+1])/2, (CT[k]+CT[k+1])/2 and p_mid = (p[k]+p[k+1])/2 :
+#
+#      drho = b(mid)*(SA[k+1]-SA[k]) - a(mid)*(CT[k+1]-CT[k])
+#      N2   = g^2 * drho / ( p[k+1]-p[k] ) / db2Pa
+#
+#  The density itself is not evaluated. The vertical axis is processed
+#  level by level, so that only a few 2-D slabs of temporaries are held
+#  in memory besides the outputs.
+#
+# INPUT:
+#  SA   =  Absolute Salinity                                       [ g/kg ]
+#  CT   =  Conservative Temperature (ITS-90)                      [ deg C ]
+#  p    =  sea pressure                                            [ dbar ]
+#          ( i.e. absolute pressure - 10.1325 dbar )
+#  axis =  index of the vertical axis of SA & CT (default 0), along
+#          which pressure is increasing
+#
+#  SA & CT need to have the same dimensions. p is either a 1-D pressure
+#  axis of the same length as the vertical axis, or has the same
+#  dimensions as SA & CT.
+#
+# OUTPUT:
+#  N2    =  squared buoyancy frequency                          [ 1/s^2 ]
+#  drho  =  local density difference (level k+1 minus k)      [ kg/m^3 ]
+#  p_mid =  pressure of the interfaces                             [ dbar ]
+#
+#  N2 & drho have the dimensions of SA & CT, with one element less along
+#  the vertical axis, which is kept at position axis. p_mid is a 1-D
+#  axis if p is 1-D, and has the dimensions of N2 & drho otherwise.
+#
+# CHECK VALUES (SA=[30,30.1]g/kg, CT=[10,9]degC, p=[1000,1010]dbar):
+#  N2    = 2.420059769e-04
+#  drho  = 2.516429344e-01
+#  p_mid = 1005.
+#
+# AUTHOR:
+#  Fabien Roquet
+
+def polyTEOS10_bsq_N2(SA,CT,p,axis=0):
+    
+    grav = 9.80665; db2Pa = 1e4
+    
+    # reduced variables
+    SAu = 40.*35.16504/35.; CTu = 40.; Zu=1e4; deltaS = 32.
+    
+    # vertical axis first (views, no copy)
+    SA = npy.moveaxis ( npy.asarray(SA), axis, 0 )
+    CT = npy.moveaxis ( npy.asarray(CT), axis, 0 )
+    p  = npy.asarray(p)
+    nz = SA.shape[0]
+    p1d = p.ndim == 1
+    if p1d:
+        if p.shape[0] != nz:
+            raise ValueError("p has %d levels, expected %d" % (p.shape[0],nz))
+        p = p.reshape ( (-1,) + (1,)*(SA.ndim-1) )
+    elif p.shape == npy.moveaxis(SA,0,axis).shape:
+        p = npy.moveaxis ( p, axis, 0 )
+    else:
+        raise ValueError("p must be 1-D or have the dimensions of SA & CT, " \
+                         "got shape %r" % (p.shape,))
+    
+    shape = (nz-1,) + npy.broadcast_shapes(SA.shape[1:],CT.shape[1:],p.shape[1:])
+    dtype = npy.result_type(SA,CT,p,1.)
+    N2    = npy.empty(shape,dtype)
+    drho  = npy.empty(shape,dtype)
+    if p1d:
+        p_mid = 0.5 * ( p[1:] + p[:-1] ).ravel()
+    else:
+        p_mid = npy.empty(shape,dtype)
+    
+    for k in range(nz-1):
+        
+        # properties at the interface between levels k and k+1
+        SAm = 0.5 * ( SA[k] + SA[k+1] )
+        CTm = 0.5 * ( CT[k] + CT[k+1] )
+        pm  = 0.5 * (  p[k] +  p[k+1] )
+        ss  = npy.sqrt ( (SAm+deltaS)/SAu )
+        tt  = CTm / CTu
+        pp  =  pm / Zu
+        a,b = _polyTEOS10_bsq_ab(ss,tt,pp)
+        
+        # local density difference and buoyancy frequency
+        drho[k]  = b * ( SA[k+1] - SA[k] ) - a * ( CT[k+1] - CT[k] )
+        N2[k]    = grav**2 * drho[k] / ( ( p[k+1] - p[k] ) * db2Pa )
+        if not p1d:
+            p_mid[k] = pm
+    
+    N2    = npy.moveaxis ( N2,    0, axis )
+    drho  = npy.moveaxis ( drho,  0, axis )
+    if not p1d:
+        p_mid = npy.moveaxis ( p_mid, 0, axis )
+    
+    return N2,drho,p_mid
     
     
 # polyTEOS10_stif             in-situ density (55-term polynomial equation)
@@ -223,6 +349,11 @@ def polyTEOS10_stif(SA,CT,p):
     tt   = CT / CTu
     pp   =   p / Zu
     
+    return _polyTEOS10_stif(ss,tt,pp)
+
+
+def _polyTEOS10_stif(ss,tt,pp):
+    
     # vertical reference profile of density
     R10 = 4.5238001132e-02; R11 = -5.0691457704e-03; R12 = 2.1990865986e-04; 
     R13 = 6.2587720090e-05; R14 = 1.5194795322e-05; R15 = -1.6777531159e-06;
@@ -381,6 +512,11 @@ def polyTEOS10_55t(SA,CT,p):
     tt   = CT / CTu
     pp   =   p / Zu
     
+    return _polyTEOS10_55t(ss,tt,pp)
+
+
+def _polyTEOS10_55t(ss,tt,pp):
+    
     # vertical reference profile of specific volume
     V00 = -4.4015007269e-05; V01 = 6.9232335784e-06; V02 = -7.5004675975e-07; 
     V03 = 1.7009109288e-08; V04 = -1.6884162004e-08; V05 = 1.9613503930e-09; 
@@ -540,6 +676,11 @@ def polyTEOS10_75t(SA,CT,p):
     tt   = CT / CTu
     pp   =   p / Zu
     
+    return _polyTEOS10_75t(ss,tt,pp)
+
+
+def _polyTEOS10_75t(ss,tt,pp):
+    
     # vertical reference profile of specific volume
     V00 = -4.4015007269e-05; V01 = 6.9232335784e-06; V02 = -7.5004675975e-07;
     V03 = 1.7009109288e-08; V04 = -1.6884162004e-08; V05 = 1.9613503930e-09;
@@ -671,6 +812,141 @@ def polyTEOS10_75t(SA,CT,p):
     beta = b / ss / specvol;
     
     return specvol,alpha,beta,v0,delta
+    
+    
+# polyTEOS10_errmap           error-budget maps between polyTEOS10 variants
+#==========================================================================
+#
+# USAGE:
+#     stats = polyTEOS10_errmap(SA,CT,p,ref='75t',
+#                               variants=('bsq','stif','55t'),
+#                               percentiles=(50.,90.,99.),nk=8,filename=None)
+#
+# DESCRIPTION:
+#  Sweeps the lattice spanned by the 1-D axes SA, CT and p, and compares
+#  the in-situ density, thermal expansion and haline contraction of each
+#  variant to those of the reference variant ref. For the specific volume
+#  variants, density is 1/specvol; for the density variants, alpha = a/rho
+#  and beta = b/rho.
+#
+#  The lattice is processed in chunks of nk pressure levels. In each
+#  chunk, the reduced variables are computed once and shared by all the
+#  variants. Chunks always hold the whole SA-CT plane, as the percentiles
+#  need one full plane per level: the working memory is up to about 18
+#  double precision arrays of size nk x len(SA) x len(CT), i.e. roughly
+#  150 x nk x len(SA) x len(CT) bytes (use nk=1 for the smallest
+#  footprint), in addition to the (SA,CT) maps of the output.
+#
+#  Statistics of the absolute errors are computed per pressure level
+#  (max, rms and percentiles over the SA-CT plane) and per SA-CT point
+#  (max and rms over the pressure axis). If filename is given, the
+#  statistics are also saved in a compressed .npz file.
+#
+# INPUT:
+#  SA   =  Absolute Salinity axis                                  [ g/kg ]
+#  CT   =  Conservative Temperature axis (ITS-90)                 [ deg C ]
+#  p    =  sea pressure axis                                       [ dbar ]
+#          ( i.e. absolute pressure - 10.1325 dbar )
+#  ref  =  reference variant, one of 'bsq', 'stif', '55t' or '75t'
+#  variants    =  variants compared to ref (a name or a sequence)
+#  percentiles =  percentiles computed per pressure level            [ % ]
+#  nk   =  number of pressure levels per chunk (positive integer)
+#  filename    =  optional .npz output file
+#
+# OUTPUT:
+#  stats =  dictionary of arrays, with the quantities 'rho' [ kg/m^3 ],
+#           'alpha' [ 1/K ] and 'beta' [ 1/(g/kg) ] along axis 1:
+#   max_p   =  max abs. error per level        (nvariant,3,len(p))
+#   rms_p   =  rms error per level             (nvariant,3,len(p))
+#   pct_p   =  error percentiles per level     (nvariant,3,npct,len(p))
+#   max_TS  =  max abs. error per SA-CT point  (nvariant,3,len(SA),len(CT))
+#   rms_TS  =  rms error per SA-CT point       (nvariant,3,len(SA),len(CT))
+#  together with the axes SA, CT, p, variants, quantities, percentiles
+#  and ref.
+#
+# AUTHOR:
+#  Fabien Roquet
+
+def polyTEOS10_errmap(SA,CT,p,ref='75t',variants=('bsq','stif','55t'), \
+                      percentiles=(50.,90.,99.),nk=8,filename=None):
+    
+    # rho, alpha, beta of each variant from the shared reduced variables
+    def rab_bsq(ss,tt,pp):
+        rho,a,b,r0,r = _polyTEOS10_bsq(ss,tt,pp)
+        return rho, a/rho, b/rho
+    def rab_stif(ss,tt,pp):
+        rho,a,b,r1,rdot = _polyTEOS10_stif(ss,tt,pp)
+        return rho, a/rho, b/rho
+    def rab_55t(ss,tt,pp):
+        specvol,alpha,beta,v0,delta = _polyTEOS10_55t(ss,tt,pp)
+        return 1./specvol, alpha, beta
+    def rab_75t(ss,tt,pp):
+        specvol,alpha,beta,v0,delta = _polyTEOS10_75t(ss,tt,pp)
+        return 1./specvol, alpha, beta
+    funcs  = {'bsq':rab_bsq, 'stif':rab_stif, '55t':rab_55t, '75t':rab_75t}
+    deltaS = {'bsq':32., 'stif':32., '55t':32., '75t':24.}
+    
+    if isinstance(variants,str):
+        variants = (variants,)
+    variants = tuple(variants)
+    for v in (ref,) + variants:
+        if v not in funcs:
+            raise ValueError("unknown polyTEOS10 variant: %r" % (v,))
+    if isinstance(nk,bool) or not isinstance(nk,(int,npy.integer)) or nk < 1:
+        raise ValueError("nk must be a positive integer: %r" % (nk,))
+    
+    SA = npy.asarray(SA,dtype=float).ravel()
+    CT = npy.asarray(CT,dtype=float).ravel()
+    p  = npy.asarray(p, dtype=float).ravel()
+    quantities = ('rho','alpha','beta')
+    nv = len(variants); nq = len(quantities); npct = len(percentiles)
+    
+    max_p  = npy.zeros((nv,nq,p.size))
+    rms_p  = npy.zeros((nv,nq,p.size))
+    pct_p  = npy.zeros((nv,nq,npct,p.size))
+    max_TS = npy.zeros((nv,nq,SA.size,CT.size))
+    rms_TS = npy.zeros((nv,nq,SA.size,CT.size))
+    
+    # reduced variables, SA along axis 1 and CT along axis 2
+    SAu = 40.*35.16504/35.; CTu = 40.; Zu=1e4
+    ss = {}
+    for v in (ref,) + variants:
+        if deltaS[v] not in ss:
+            ss[deltaS[v]] = npy.sqrt ( (SA[None,:,None]+deltaS[v])/SAu )
+    tt = CT[None,None,:] / CTu
+    
+    for k0 in range(0,p.size,nk):
+        k1 = min(k0+nk,p.size)
+        pp = p[k0:k1,None,None] / Zu
+        
+        ref_q = funcs[ref](ss[deltaS[ref]],tt,pp)
+        for iv,v in enumerate(variants):
+            if v == ref:
+                # errors of ref against itself are zero
+                continue
+            var_q = funcs[v](ss[deltaS[v]],tt,pp)
+            for iq in range(nq):
+                err = npy.abs ( var_q[iq] - ref_q[iq] )
+                err = npy.broadcast_to ( err, (k1-k0,SA.size,CT.size) )
+                err2 = err * err
+                max_p[iv,iq,k0:k1] = err.max(axis=(1,2))
+                rms_p[iv,iq,k0:k1] = npy.sqrt ( err2.mean(axis=(1,2)) )
+                if npct:
+                    pct_p[iv,iq,:,k0:k1] = npy.percentile(err,percentiles,axis=(1,2))
+                npy.maximum ( max_TS[iv,iq], err.max(axis=0), out=max_TS[iv,iq] )
+                rms_TS[iv,iq] += err2.sum(axis=0)
+    
+    rms_TS = npy.sqrt ( rms_TS / p.size )
+    
+    stats = {'SA':SA, 'CT':CT, 'p':p, 'ref':npy.array(ref), \
+             'variants':npy.array(variants), 'quantities':npy.array(quantities), \
+             'percentiles':npy.array(percentiles,dtype=float), \
+             'max_p':max_p, 'rms_p':rms_p, 'pct_p':pct_p, \
+             'max_TS':max_TS, 'rms_TS':rms_TS}
+    if filename is not None:
+        npy.savez_compressed(filename,**stats)
+    
+    return stats
 
 
 